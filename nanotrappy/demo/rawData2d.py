@@ -1,11 +1,68 @@
 # -*- coding: utf-8 -*-
 import nanotrappy as nt
 import os
+import sys
+import hashlib
+import logging
 import numpy as np
+import numba
 import matplotlib.pyplot as plt
+from matplotlib import cm
+from matplotlib.colors import Normalize
 from nanotrappy.utils.physicalunits import *
 
+log = logging.getLogger(__name__)
+
+# NANOTRAPPY_USE_GPU=1 runs the reductions on a CUDA device through cupy, if it is installed
+xp = np
+to_np = np.asarray
+if os.environ.get("NANOTRAPPY_USE_GPU", "0") == "1":
+    try:
+        import cupy as xp
+
+        to_np = xp.asnumpy
+    except ImportError:
+        log.warning("cupy is not installed, the reductions will run on the CPU")
+
+
+@numba.njit(cache=True, fastmath=True)
+def scan_potential(data_2d, row):
+    """Finds in a single sweep the global minimum of a 2D potential, its position and the minimum along one row.
+
+    Args:
+        data_2d (array): 2D potential array.
+        row (int): Index of the row along which the minimum is also computed (saddle point estimate).
+
+    Returns:
+        (tuple): containing:
+
+            - float: Lowest value of the potential.
+            - int: Row index of the minimum.
+            - int: Column index of the minimum.
+            - float: Lowest value of the potential along the given row.
+    """
+    n0, n1 = data_2d.shape
+    mn = data_2d[0, 0]
+    mi = 0
+    mj = 0
+    row_min = data_2d[row, 0]
+    for i in range(n0):
+        for j in range(n1):
+            v = data_2d[i, j]
+            if v < mn:
+                mn = v
+                mi = i
+                mj = j
+            if i == row and v < row_min:
+                row_min = v
+    return mn, mi, mj, row_min
+
+
 if __name__ == "__main__":
+    # Run with --no-plot to skip the heatmap (non-interactive runs, benchmarks) and -v for the debug diagnostics
+    logging.basicConfig(level=logging.DEBUG if "-v" in sys.argv else logging.INFO, format="[%(levelname)s] %(message)s")
+    show_plot = "--no-plot" not in sys.argv
+
     # Folder for data storage
     datafolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testfolder")
 
@@ -23,37 +80,87 @@ if __name__ == "__main__":
     # Initialize simulation
     Simul = nt.Simulation(syst, nt.SiO2(), trap, datafolder)
     Simul.geometry = nt.PlaneXY(normal_coord=0)
-    Simul.compute()
 
-    # Access the raw data (potentials attribute or Etot depending on need)
-    raw_2d_data = Simul.total_potential()
+    # Output file tagged with the parameters of the simulation, so that a cached result is never reused for another trap
+    params = (
+        str(syst.state),
+        int(syst.f),
+        str(Simul.material),
+        tuple(trap.lmbdas),
+        tuple(trap.powers),
+        Simul.geometry.name,
+        Simul.geometry.normal_coord,
+    )
+    params_hash = hashlib.sha1(repr(params).encode()).hexdigest()[:10]
+    # NANOTRAPPY_COMPRESS=1 stores a compressed .npz instead (smaller on disk, but cannot be memory-mapped back)
+    compress = os.environ.get("NANOTRAPPY_COMPRESS", "0") == "1"
+    output_file = f"raw_2d_trap_data_{params_hash}" + (".npz" if compress else ".npy")
+    selected_mf_state = 0  # Index of the mf state to display. Note that it's not the same as mf since index can only be positive.
+
+    if os.path.exists(output_file) and os.path.getmtime(output_file) > os.path.getmtime(__file__):
+        if compress:
+            with np.load(output_file) as f:
+                raw_2d_data = f["data"]
+        else:
+            raw_2d_data = np.load(output_file, mmap_mode="r")
+        log.info("2D raw trap data loaded from: %s", output_file)
+        data_2d = np.ascontiguousarray(raw_2d_data[:, :, selected_mf_state])
+    else:
+        Simul.compute()
+
+        # Access the raw data (potentials attribute or Etot depending on need)
+        # Computed in float64, stored and displayed in float32 (plenty for a mK-scale potential map)
+        raw_2d_data = np.ascontiguousarray(Simul.total_potential(), dtype=np.float32)
 
-    # Save raw data as .npy file
-    output_file = "raw_2d_trap_data.npy"
-    np.save(output_file, raw_2d_data)
-    print(f"2D raw trap data saved to: {output_file}")
+        if compress:
+            np.savez_compressed(output_file, data=raw_2d_data)
+            log.info(
+                "2D raw trap data saved to: %s (compression ratio %.1f)",
+                output_file,
+                raw_2d_data.nbytes / os.path.getsize(output_file),
+            )
+        else:
+            # Save raw data as .npy file, written through a memory map created at its final size
+            out = np.lib.format.open_memmap(output_file, mode="w+", dtype=raw_2d_data.dtype, shape=raw_2d_data.shape)
+            np.copyto(out, raw_2d_data)
+            out.flush()
+            del out
+            log.info("2D raw trap data saved to: %s", output_file)
+
+        # contiguous copy of the mf state from the total potential computed above, as when it is loaded from disk
+        data_2d = np.ascontiguousarray(raw_2d_data[:, :, selected_mf_state])
 
     # Check data dimensions and preview
-    print("Shape of raw data:", raw_2d_data.shape)
-    print("Sample data (top-left corner):")
-    print(raw_2d_data[:5, :5])
+    log.debug("Shape of raw data: %s", raw_2d_data.shape)
+    log.debug("Sample data (top-left corner):\n%s", raw_2d_data[:5, :5])
 
-    # Optional: Visualize as heatmap
-    selected_mf_state = 0  # Index of the mf state to display. Note that it's not the same as mf since index can only be positive.
-    data_2d = raw_2d_data[:, :, selected_mf_state]
-    print(np.shape(data_2d))
-    min_value = np.min(data_2d)  # Find the minimum value in the 2D array
-    min_position = np.unravel_index(np.argmin(data_2d), data_2d.shape)  # Get coordinates of min value
-    data_2d_slice = data_2d[100,:]
-    val2 = np.min(data_2d_slice)
-
-
-    print(f"  Lowest potential value: {min_value}")
-    print(f"  Position (row, col): {min_position}")
-    print(f"  Val2: {val2}") #saddle
-    plt.imshow(data_2d, extent=[-800, 800, -800, 800], origin='lower', aspect='auto', cmap="viridis")
-    plt.colorbar(label="Potential")
-    plt.title("2D Raw Trap Data")
-    plt.xlabel("X axis (nm)")
-    plt.ylabel("Y axis (nm)")
-    plt.show()
+    log.debug("Shape of the displayed mf state: %s", data_2d.shape)
+    # Global minimum, its position and the minimum along row 100 (saddle), all in one pass
+    d = xp.asarray(data_2d)
+    if xp is np:
+        min_value, min_row, min_col, val2 = scan_potential(data_2d, 100)
+        max_value = data_2d.max()
+    else:
+        min_value, max_value, val2 = float(d.min()), float(d.max()), float(d[100, :].min())
+        min_row, min_col = divmod(int(d.argmin()), d.shape[1])
+    min_position = (min_row, min_col)
+
+    log.info("  Lowest potential value: %s", min_value)
+    log.info("  Position (row, col): %s", min_position)
+    log.info("  Val2: %s", val2)  # saddle
+
+    if show_plot:
+        # Optional: Visualize as heatmap
+        # Colormap applied once in NumPy, imshow then only blits a ready-made RGBA image
+        norm = to_np((d - min_value) / (max_value - min_value))
+        rgba = (cm.viridis(norm) * 255).astype(np.uint8)
+        plt.imshow(rgba, extent=[-800, 800, -800, 800], origin='lower', aspect='auto')
+        plt.colorbar(
+            mappable=cm.ScalarMappable(norm=Normalize(vmin=min_value, vmax=max_value), cmap="viridis"),
+            ax=plt.gca(),
+            label="Potential",
+        )
+        plt.title("2D Raw Trap Data")
+        plt.xlabel("X axis (nm)")
+        plt.ylabel("Y axis (nm)")
+        plt.show()
@@ -2,7 +2,7 @@ from nanotrappy.trapping.beam import Beam
 from nanotrappy.trapping.atomicsystem import atomiclevel, atomicsystem
 from nanotrappy.utils.physicalunits import *
 from nanotrappy.utils.utils import *
-from nanotrappy.trapping.simulator import SequentialSimulator, ParallelSimulator
+from nanotrappy.trapping.simulator import SequentialSimulator, ParallelSimulator, JitSimulator
 from nanotrappy.trapping.geometry import *
 
 import nanotrappy.utils.vdw as vdw
@@ -290,22 +290,42 @@ class Simulation:
             return
             # return self.total_potential()
 
-    def total_potential(self):
+    def beam_weight(self, i):
+        """Returns the power by which the potential of the i-th beam of the trap is rescaled in the total potential.
+
+        Args:
+            i (int): Index of the beam in the trap.
+
+        Returns:
+            float: the power of the first beam for a BeamPair, the power of the beam for a Beam and the total power for a BeamSum (W).
+        """
+        beam = self.trap.beams[i]
+        if beam.isBeamSum():
+            return np.sum(beam.get_power())
+        return beam.get_power()[0]
+
+    def total_potential(self, mf_index=None):
         """Uses the potentials attributes of the Simulation object for each beam to return their weighted sum with the specified powers
 
+        Args:
+            mf_index (int): Index of a single mf state (between 0 and 2F). If given, only this state is summed and a
+                C-contiguous array without the mf axis is returned. In that case the total_potential_noCP and total_vecs
+                attributes are left untouched. Defaults to None (all mf states).
+
         Returns:
             total potential : array with shape(length coordinate 1,length coordinate 2,number of possbile mf states)
         """
+        if mf_index is not None:
+            total_mf = np.zeros(np.shape(self.potentials[0])[:-1], dtype="float")
+            for (i, potential) in enumerate(self.potentials):
+                total_mf += self.beam_weight(i) * np.real(potential[..., mf_index])
+            total_mf += np.real(self.CP)
+            return np.squeeze(total_mf)
+
         self.total_potential_noCP = np.zeros(np.shape(self.potentials[0]), dtype="float")
         self.total_vecs = np.zeros(np.shape(self.vecs[0]), dtype="complex")
         for (i, potential) in enumerate(self.potentials):
-            if self.trap.beams[i].isBeamPair():
-                p = self.trap.beams[i].get_power()[0]
-            elif self.trap.beams[i].isBeam():
-                p = self.trap.beams[i].get_power()
-            elif self.trap.beams[i].isBeamSum():
-                p = np.sum(self.trap.beams[i].get_power())
-                print(p)
+            p = self.beam_weight(i)
             self.total_potential_noCP = self.total_potential_noCP + p * np.real(potential)
             self.total_vecs = p * self.vecs[i]
             
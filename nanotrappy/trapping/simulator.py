@@ -1,5 +1,6 @@
 import itertools
 import numpy as np
+from numba import njit, prange
 from scipy import linalg as LA
 from tqdm.contrib.concurrent import process_map
 from nanotrappy.utils.physicalunits import *
@@ -51,8 +52,7 @@ class SequentialSimulator(Simulator):
             )
             val, vec = simulation.atomicsystem.potential(Ep, Em, E0)
             simulation.potentials[(potential_number, *idx)] = np.real(val[mf_shift])
-            for id, elt in enumerate(vec):
-                simulation.vecs[(potential_number, *idx, id)] = elt
+            simulation.vecs[(potential_number, *idx)] = vec
 
     def simulate_pair(self, simulation, beam, E_fwd, E_bwd, potential_number, mf_shift):
         size = simulation.Etot.shape[1:]
@@ -82,8 +82,7 @@ class SequentialSimulator(Simulator):
             idx_order = vals.argsort()
 
             simulation.potentials[(potential_number, *idx)][:] = np.real(vals[idx_order][mf_shift])
-            for id, elt in enumerate(vec):
-                simulation.vecs[(potential_number, *idx, id)][:] = elt
+            simulation.vecs[(potential_number, *idx)] = vec
 
 
 class ParallelSimulator(Simulator):
@@ -121,8 +120,7 @@ class ParallelSimulator(Simulator):
 
             for i, elt in enumerate(output):
                 simulation.potentials[potential_number][elt][:] = np.real(results[i][0][mf_shift])
-                for id, elt_vec in enumerate(results[i][1]):
-                    simulation.vecs[potential_number][elt][id][:] = elt_vec
+                simulation.vecs[(potential_number, *elt)] = results[i][1]
 
     def simulate_pair(self, simulation, beam, E_fwd, E_bwd, potential_number, mf_shift):
         if simulation.geometry.dimension == 1:
@@ -163,5 +161,110 @@ class ParallelSimulator(Simulator):
             )
             for i, elt in enumerate(output):
                 simulation.potentials[potential_number][elt][:] = 0.5 * np.real(results[i][0][mf_shift])
-                for id, elt_vec in enumerate(results[i][1]):
-                    simulation.vecs[potential_number][elt][id][:] = elt_vec
+                simulation.vecs[(potential_number, *elt)] = results[i][1]
+
+
+def _hamiltonian_basis(shift, ncomp):
+    """Decomposes a light shift operator, sesquilinear in the field components, on the products of these components.
+
+    Args:
+        shift (callable): function of a vector of ncomp field components returning the light shift matrix.
+        ncomp (int): number of field components.
+
+    Returns:
+        array: basis with shape (ncomp, ncomp, number of mf states, number of mf states), such that
+        shift(c) = sum over a, b of c[a] * conj(c[b]) * basis[a, b].
+    """
+    unit = np.eye(ncomp, dtype="complex")
+    diag = [np.asarray(shift(unit[a]), dtype="complex") for a in range(ncomp)]
+    nlev = diag[0].shape[0]
+    basis = np.zeros((ncomp, ncomp, nlev, nlev), dtype="complex")
+    for a in range(ncomp):
+        basis[a, a] = diag[a]
+        for b in range(a + 1, ncomp):
+            s1 = shift(unit[a] + unit[b]) - diag[a] - diag[b]
+            s2 = shift(unit[a] + 1j * unit[b]) - diag[a] - diag[b]
+            basis[a, b] = (s1 + 1j * s2) / 2
+            basis[b, a] = (s1 - 1j * s2) / 2
+    return basis
+
+
+@njit(cache=True, fastmath=True)
+def _hamiltonian_at(fields, q, basis):
+    nlev = basis.shape[2]
+    H = np.zeros((nlev, nlev), dtype=np.complex128)
+    for a in range(fields.shape[0]):
+        for b in range(fields.shape[0]):
+            H += fields[a, q] * np.conj(fields[b, q]) * basis[a, b]
+    return H
+
+
+@njit(parallel=True, cache=True, fastmath=True)
+def _fill_potential(out_pot, out_vecs, fields, basis, mf_shift, sort_vecs):
+    for q in prange(fields.shape[1]):
+        vals, vecs = np.linalg.eig(_hamiltonian_at(fields, q, basis))
+        order = np.argsort(vals.real)
+        for k in range(mf_shift.shape[0]):
+            out_pot[q, k] = vals[order[mf_shift[k]]].real
+        # rows sorted as in AtomicSystem.potential, or left in the order of eig as in SequentialSimulator.simulate_pair
+        for r in range(order.shape[0]):
+            out_vecs[q, r, :] = vecs[order[r], :] if sort_vecs else vecs[r, :]
+
+
+class JitSimulator(Simulator):
+    """Simulator compiling the per-point diagonalization with numba and running it on all the cores.
+
+    The light shift operator is first decomposed on the products of the field components, so that the compiled kernel
+    only handles arrays. The first call pays for the compilation, which is then cached on disk.
+    """
+
+    def _run(self, simulation, potential_number, mf_shift, fields, shift, sort_vecs=True):
+        size = simulation.Etot.shape[1:]
+        fields = np.ascontiguousarray(fields.reshape(fields.shape[0], -1), dtype="complex")
+        basis = _hamiltonian_basis(shift, fields.shape[0])
+        mf_shift = np.asarray(mf_shift, dtype=np.int64)
+        nlev = basis.shape[2]
+
+        out_pot = np.zeros((fields.shape[1], len(mf_shift)))
+        out_vecs = np.zeros((fields.shape[1], nlev, nlev), dtype="complex")
+        _fill_potential(out_pot, out_vecs, fields, basis, mf_shift, sort_vecs)
+
+        simulation.potentials[potential_number] = out_pot.reshape(*size, len(mf_shift))
+        simulation.vecs[potential_number] = out_vecs.reshape(*size, nlev, nlev)
+
+    def simulate(self, simulation, potential_number, mf_shift):
+        atomicsystem = simulation.atomicsystem
+        fields = np.array(
+            self.convert_fields_to_spherical_basis(simulation.Etot[0], simulation.Etot[1], simulation.Etot[2])
+        )
+
+        def shift(c):
+            return atomicsystem.totalshift(*c) / (mK * kB)
+
+        self._run(simulation, potential_number, mf_shift, fields, shift)
+
+    def simulate_pair(self, simulation, beam, E_fwd, E_bwd, potential_number, mf_shift):
+        atomicsystem = simulation.atomicsystem
+        alpha0_f, alpha1_f, alpha2_f = atomicsystem.set_alphas(beam.get_lmbda()[0])
+        alpha0_b, alpha1_b, alpha2_b = atomicsystem.set_alphas(beam.get_lmbda()[1])
+        fields = np.concatenate(
+            (
+                self.convert_fields_to_spherical_basis(E_fwd[0], E_fwd[1], E_fwd[2]),
+                self.convert_fields_to_spherical_basis(E_bwd[0], E_bwd[1], E_bwd[2]),
+            )
+        )
+
+        def shift(c):
+            tot_shift_f = (
+                -1.0 * alpha0_f * atomicsystem.delta_scalar(*c[:3])
+                - 1.0 * alpha1_f * atomicsystem.delta_vector(*c[:3])
+                - 1.0 * alpha2_f * atomicsystem.delta_tensor(*c[:3])
+            )
+            tot_shift_b = (
+                -1.0 * alpha0_b * atomicsystem.delta_scalar(*c[3:])
+                - 1.0 * alpha1_b * atomicsystem.delta_vector(*c[3:])
+                - 1.0 * alpha2_b * atomicsystem.delta_tensor(*c[3:])
+            )
+            return (tot_shift_f + tot_shift_b) / (mK * kB)
+
+        self._run(simulation, potential_number, mf_shift, fields, shift, sort_vecs=False)
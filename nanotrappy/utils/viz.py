@@ -3,11 +3,15 @@ from copy import copy
 from nanotrappy.trapping.geometry import AxisX, AxisY, AxisZ
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
+from matplotlib.collections import LineCollection
+from matplotlib.backend_bases import TimerBase
 import numpy as np
 from operator import itemgetter
+from collections import OrderedDict
 import matplotlib.colors as colors
 import matplotlib.cm as cmx
-from scipy.signal import find_peaks
+import numba
+from numba import njit, prange
 
 import re
 import itertools
@@ -52,6 +56,228 @@ import matplotlib
 matplotlib.rcParams["axes.unicode_minus"] = False
 
 
+def _nearest(axis, val):
+    """Index of the point of a sorted coordinate array closest to val, the lower one on ties as with argmin.
+
+    val can also be an array of values, in which case an array of indices is returned.
+    """
+    i = np.clip(np.searchsorted(axis, val), 1, len(axis) - 1)
+    idx = np.where(val - axis[i - 1] <= axis[i] - val, i - 1, i)
+    return int(idx) if np.ndim(idx) == 0 else idx
+
+
+def _cross_conj_imag(E, k):
+    """Imaginary part of the component k of E x conj(E), the complex field E having its 3 components on the first axis.
+
+    Only the two other components of the field are needed: Im(E_i conj(E_j) - E_j conj(E_i)) = 2 Im(E_i conj(E_j)).
+    """
+    i, j = (k + 1) % 3, (k + 2) % 3
+    return 2 * np.imag(E[i] * np.conjugate(E[j]))
+
+
+@njit(cache=True, nogil=True)
+def _find_minima(y, distance, min_prom):
+    """Local minima of a 1D trap, as found by ``scipy.signal.find_peaks(-y, distance, prominence)``.
+
+    Only the minima of equal depth closer than distance can differ: they are ordered by index, the rightmost one being
+    kept, while scipy keeps the one left by the unstable argsort of NumPy.
+
+    Args:
+        y (array): 1D trap.
+        distance (float): Minimal number of samples between two minima, the deepest ones being kept first.
+        min_prom (float): Minimal prominence of the minima.
+
+    Returns:
+        (tuple): containing:
+
+            - array: Indices of the minima.
+            - array: Indices of their left bases.
+            - array: Their prominences.
+    """
+    x = -y
+    n = len(x)
+    # local maxima of -y, the middle of flat plateaus being taken
+    peaks = np.empty(n // 2 + 1, dtype=np.int64)
+    n_peaks = 0
+    i = 1
+    while i < n - 1:
+        if x[i - 1] < x[i]:
+            i_ahead = i + 1
+            while i_ahead < n - 1 and x[i_ahead] == x[i]:
+                i_ahead += 1
+            if x[i_ahead] < x[i]:
+                peaks[n_peaks] = (i + i_ahead - 1) // 2
+                n_peaks += 1
+                i = i_ahead
+        i += 1
+    peaks = peaks[:n_peaks]
+
+    # removes the peaks closer than distance to a higher one
+    keep = np.ones(n_peaks, dtype=np.bool_)
+    dist = np.ceil(distance)
+    # stable sort, the ties are broken by index
+    order = np.argsort(x[peaks], kind="mergesort")
+    for i in range(n_peaks - 1, -1, -1):
+        j = order[i]
+        if not keep[j]:
+            continue
+        k = j - 1
+        while k >= 0 and peaks[j] - peaks[k] < dist:
+            keep[k] = False
+            k -= 1
+        k = j + 1
+        while k < n_peaks and peaks[k] - peaks[j] < dist:
+            keep[k] = False
+            k += 1
+    peaks = peaks[keep]
+
+    # prominences, the bases being the lowest points before reaching a higher value on each side
+    n_peaks = len(peaks)
+    left_bases = np.empty(n_peaks, dtype=np.int64)
+    prominences = np.empty(n_peaks, dtype=np.float64)
+    for p in range(n_peaks):
+        peak = peaks[p]
+        i = left_base = peak
+        left_min = x[peak]
+        while i >= 0 and x[i] <= x[peak]:
+            if x[i] < left_min:
+                left_min = x[i]
+                left_base = i
+            i -= 1
+        i = peak
+        right_min = x[peak]
+        while i <= n - 1 and x[i] <= x[peak]:
+            if x[i] < right_min:
+                right_min = x[i]
+            i += 1
+        left_bases[p] = left_base
+        prominences[p] = x[peak] - max(left_min, right_min)
+
+    selected = prominences >= min_prom
+    return peaks[selected], left_bases[selected], prominences[selected]
+
+
+@njit(cache=True, nogil=True)
+def _select_minimum(peaks, prominences, threshold):
+    """Position in peaks of the most prominent minimum further than threshold from the edge, -1 if there is none."""
+    best = -1
+    for p in range(len(peaks)):
+        if peaks[p] > threshold and (best < 0 or prominences[p] > prominences[best]):
+            best = p
+    return best
+
+
+@njit(cache=True, nogil=True)
+def _lowest_minimum(y, distance, min_prom, threshold):
+    """Searches the minima of a 1D trap and selects the one get_min_trap keeps, without going back to Python.
+
+    Args:
+        y (array): 1D trap.
+        distance (float): Minimal number of samples between two minima.
+        min_prom (float): Minimal prominence of the minima.
+        threshold (int): Index under which the minima are too close to the edge of the structure.
+
+    Returns:
+        (tuple): containing:
+
+            - int: Number of minima found, including the ones too close to the edge.
+            - int: Index of the selected minimum, -1 if none is further than threshold.
+            - float: Its prominence.
+            - int: Index of its left base.
+    """
+    peaks, left_bases, prominences = _find_minima(y, distance, min_prom)
+    best = _select_minimum(peaks, prominences, threshold)
+    if best < 0:
+        return len(peaks), -1, 0.0, -1
+    return len(peaks), peaks[best], prominences[best], left_bases[best]
+
+
+@njit(cache=True, nogil=True)
+def _nearest_sorted(axis, val):
+    """Compiled counterpart of _nearest for a single value."""
+    i = min(max(np.searchsorted(axis, val), 1), len(axis) - 1)
+    return i - 1 if val - axis[i - 1] <= axis[i] - val else i
+
+
+@njit(cache=True, nogil=True)
+def _quadratic_curvature(y, p):
+    """Second derivative of the least-squares parabola through the points (y, p), nan if it is not defined.
+
+    The coordinates are centered and scaled on [-1, 1] before solving the normal equations,
+    the coordinates in meters being too small to be squared as is.
+    """
+    n = len(y)
+    if n < 3:
+        return np.nan
+    center = 0.5 * (y[0] + y[n - 1])
+    scale = 0.5 * (y[n - 1] - y[0])
+    if scale == 0:
+        return np.nan
+    S0, S1, S2, S3, S4 = n, 0.0, 0.0, 0.0, 0.0
+    T0, T1, T2 = 0.0, 0.0, 0.0
+    for k in range(n):
+        t = (y[k] - center) / scale
+        t2 = t * t
+        S1 += t
+        S2 += t2
+        S3 += t2 * t
+        S4 += t2 * t2
+        T0 += p[k]
+        T1 += t * p[k]
+        T2 += t2 * p[k]
+    # Cramer's rule on [[S4, S3, S2], [S3, S2, S1], [S2, S1, S0]] (a, b, c) = (T2, T1, T0)
+    det = S4 * (S2 * S0 - S1 * S1) - S3 * (S3 * S0 - S1 * S2) + S2 * (S3 * S1 - S2 * S2)
+    if det == 0:
+        return np.nan
+    det_a = T2 * (S2 * S0 - S1 * S1) - S3 * (T1 * S0 - S1 * T0) + S2 * (T1 * S1 - S2 * T0)
+    return 2 * det_a / det / scale**2
+
+
+@njit(parallel=True, cache=True)
+def _sweep_row(P1, Prange2, U0, U1, U2, yout, C_freq, pot_buf, res_pos, res_depth, res_height, res_freq):
+    """Analyses the traps U0 + P1 * U1 + P2 * U2 for all the powers P2 of a row of the optimize grid.
+
+    For each trap, the minimum is searched as in get_min_trap and the trapping frequency is taken from a
+    quadratic fit between the minimum and half the distance to its left base, on each side.
+
+    Args:
+        P1 (float): Power of the first beam (W).
+        Prange2 (array): Powers of the second beam (W).
+        U0 (array): Trap without any power (CP term).
+        U1, U2 (array): Trap of each beam for 1 W.
+        yout (array): Sorted coordinates of the traps.
+        C_freq (float): Conversion from the square root of the trap curvature (mK/m^2) to the frequency (kHz).
+        pot_buf (array): Scratch array of shape (len(Prange2), len(yout)), overwritten with the traps of the row.
+        res_pos, res_depth, res_height, res_freq (array): Filled with the position, depth (mK), barrier height (mK)
+            and trapping frequency (kHz) for each P2, nan or 0 where no minimum is found.
+            The depth and height are signed, as given by get_min_trap.
+    """
+    for j in prange(len(Prange2)):
+        pot = pot_buf[j]
+        for k in range(len(pot)):
+            pot[k] = U0[k] + P1 * U1[k] + Prange2[j] * U2[k]
+        res_pos[j], res_depth[j], res_height[j], res_freq[j] = np.nan, 0.0, 0.0, 0.0
+        n_minima, idx, prominence, left_base = _lowest_minimum(pot, 10, 1e-5, 0)
+        if idx < 0:
+            continue
+        min_pos = yout[idx]
+        depth = pot[idx]
+        height = -prominence if n_minima == 1 else prominence
+        res_pos[j] = min_pos
+        res_depth[j] = depth
+        res_height[j] = height
+
+        half_width = (min_pos - yout[left_base]) / 2
+        idx_left = _nearest_sorted(yout, min_pos - half_width)
+        idx_right = _nearest_sorted(yout, min_pos + half_width)
+        moment2 = _quadratic_curvature(yout[idx_left:idx_right], pot[idx_left:idx_right])
+        res_freq[j] = C_freq * np.sqrt(moment2)
+
+
+# set to True to search the minima of get_min_trap with scipy.signal.find_peaks instead of the compiled kernels
+_USE_FIND_PEAKS = False
+
+
 class Viz:
     """Class that contains all the visualization methods.
 
@@ -69,6 +295,14 @@ class Viz:
         # Trapping_axis is the one perpendicular to the surface if one is defined
         self.trapping_axis = trapping_axis
         self.simul = simul
+        # buffers used to tile a trap three times when looking for a minimum across the periodic boundaries
+        self._tile_buf_y = None
+        self._tile_buf_t = None
+        self._power_basis_cache = None
+        # results of the last calls to optimize, dropped when the potentials are recomputed
+        self._optimize_cache = OrderedDict()
+        self._optimize_cache_source = None
+        self._opt_cursor = None
 
         ## Convenient process of str input, to match arxiv version. Will be removed
         if isinstance(self.trapping_axis, str):
@@ -122,10 +356,19 @@ class Viz:
             coord2 = axis2.fetch_in(self.simul)
             # coord1, coord2 = getattr(self.simul, axis1.name), getattr(self.simul, axis2.name)
 
-            trap = np.real(self.simul.total_potential())[:, :, mf_index]
-            trap_noCP = np.real(self.simul.total_potential_noCP[:, :, mf_index])
+            trap = self._re(self.simul.total_potential())[:, :, mf_index]
+            trap_noCP = self._re(self.simul.total_potential_noCP[:, :, mf_index])
+            # the potentials of each beam and the CP term do not depend on the powers, the sliders only reweight them
+            # stored C-contiguous in the (coord2, coord1) orientation of pcolormesh, so no transposition is needed later
+            pots = np.ascontiguousarray(self._re(self.simul.potentials[:, :, :, mf_index]).transpose(0, 2, 1))
+            cp = np.ascontiguousarray(self._re(self.simul.CP).T)
+            # flat views of the caches and output buffers owned by the plot, refilled in place at each slider tick
+            pots_flat = pots.reshape(len(pots), -1)
+            cp_flat = cp.reshape(-1)
+            noCP_buf = np.empty(pots_flat.shape[1], dtype=np.result_type(pots_flat, np.float64))
+            mesh_buf = np.empty(pots_flat.shape[1], dtype=np.result_type(noCP_buf, cp_flat))
             fig, ax = plt.subplots()
-            plt.subplots_adjust(left=0.5, bottom=0.1)
+            fig.subplots_adjust(left=0.5, bottom=0.1)
             # the norm TwoSlopeNorm allows to fix the 0 of potential to the white color, so that we can easily distinguish between positive and negative values of the potential
             a = ax.pcolormesh(
                 coord1 / nm,
@@ -137,7 +380,7 @@ class Viz:
                 ),
                 cmap="seismic_r",
             )
-            cbar = plt.colorbar(a)
+            cbar = fig.colorbar(a, ax=ax)
             cbar.set_label("Total potential (mK)", rotation=270, labelpad=12, fontsize=14)
 
             ax.set_xlabel("%s (nm)" % (self.simul.geometry.name[0].lower()), fontsize=14)
@@ -155,7 +398,7 @@ class Viz:
             axes = []
 
             for (k, beam) in enumerate(self.simul.trap.beams):
-                axes.append(plt.axes([0.15 + k * 0.08, 0.1, 0.03, 0.75], facecolor=axcolor))
+                axes.append(fig.add_axes([0.15 + k * 0.08, 0.1, 0.03, 0.75], facecolor=axcolor))
                 slider_ax.append(
                     Slider(
                         axes[k],
@@ -174,14 +417,17 @@ class Viz:
             # x = getattr(self.simul, self.simul.geometry.name)
             x = self.simul.geometry.fetch_in(self.simul)
             fig, ax = plt.subplots()
-            plt.subplots_adjust(bottom=0.27)
+            fig.subplots_adjust(bottom=0.27)
             jet = cm = plt.get_cmap("Greys")
             cNorm = colors.Normalize(vmin=-1, vmax=len(mf))
             scalarMap = cmx.ScalarMappable(norm=cNorm, cmap=jet)
-            a = []
 
-            trap = np.real(self.simul.total_potential())
-            trap_noCP = np.real(self.simul.total_potential_noCP)
+            trap = self._re(self.simul.total_potential())
+            trap_noCP = self._re(self.simul.total_potential_noCP)
+            # the potentials of each beam and the CP term do not depend on the powers, the sliders only reweight them
+            # stored as (beam, mf, coordinate) so that the curve of each mf state is a unit-stride row
+            pots = np.ascontiguousarray(self._re(self.simul.potentials[:, :, np.asarray(mf_index)]).transpose(0, 2, 1))
+            cp = np.ascontiguousarray(self._re(self.simul.CP))[np.newaxis, :]
             ax.set_xlabel("%s (nm)" % (self.simul.geometry.name), fontsize=14)
             ax.set_ylabel("E (mK)", fontsize=14)
             plt.setp(ax.spines.values(), linewidth=1.5)
@@ -192,28 +438,34 @@ class Viz:
             )
             ax.set_ylim(-10,10)
 
-            for k in range(len(mf_index)):
-                colorVal = "k"  # scalarMap.to_rgba(k)
-                a = a + plt.plot(
-                    x / nm,
-                    trap[:, mf_index[k]],
-                    color=colorVal,
-                    label="m$_f$ = %s" % (mf[k]),
-                    linewidth=2 + 3 / len(self.simul.mf_all),
-                )
+            # all the mf curves are drawn as one collection, whose segments buffer is refilled at each update
+            segments = np.empty((len(mf_index), len(x), 2))
+            segments[:, :, 0] = x / nm
+            segments[:, :, 1] = trap[:, mf_index].T
+            colorVal = "k"  # scalarMap.to_rgba(k)
+            a = LineCollection(
+                segments,
+                colors=colorVal,
+                linewidths=2 + 3 / len(self.simul.mf_all),
+                animated=True,
+            )
+            ax.add_collection(a)
+            ax.autoscale_view()
 
             if len(mf) == 1 and len(self.simul.trap.beams) == 2:
-                (b,) = plt.plot(
+                (b,) = ax.plot(
                     x / nm,
-                    np.real(self.simul.trap.beams[0].get_power()[0] * np.real(self.simul.potentials[0, :, mf_index[0]])),
+                    self.simul.trap.beams[0].get_power()[0] * pots[0, 0],
                     color="blue",
                     linewidth=2,
+                    animated=True,
                 )
-                (r,) = plt.plot(
+                (r,) = ax.plot(
                     x / nm,
-                    np.real(self.simul.trap.beams[1].get_power()[0] * np.real(self.simul.potentials[1, :, mf_index[0]])),
+                    self.simul.trap.beams[1].get_power()[0] * pots[1, 0],
                     color="red",
                     linewidth=2,
+                    animated=True,
                 )
             else:
                 pass
@@ -223,7 +475,7 @@ class Viz:
             slider_ax = []
             axes = []
             for (k, beam) in enumerate(self.simul.trap.beams):
-                axes.append(plt.axes([0.25, 0.15 - k * 0.1, 0.6, 0.03], facecolor=axcolor))
+                axes.append(fig.add_axes([0.25, 0.15 - k * 0.1, 0.6, 0.03], facecolor=axcolor))
                 slider_ax.append(
                     Slider(
                         axes[k],
@@ -235,9 +487,14 @@ class Viz:
                     )
                 )
                 slider_ax[k].label.set_size(14)
+                # the sliders are redrawn with the curves by the blitting below
+                slider_ax[k].drawon = False
+
+            dynamic_artists = [a] + ([b, r] if len(mf) == 1 and len(self.simul.trap.beams) == 2 else []) + axes
+            blit = self._blitter(fig, dynamic_artists)
 
             cursor = mplcursors.cursor(
-                a,
+                [a],
                 highlight=True,
                 highlight_kwargs=_custom_highlight_kwargs,
                 annotation_kwargs=_custom_annotation_kwargs,
@@ -245,14 +502,18 @@ class Viz:
 
             @cursor.connect("add")
             def on_add(sel):
-                artist = sel.artist
-                label = artist.get_label() or ""
-                mf = self.simul.atomicsystem.f + int(label.split()[2])
+                # the index of a selection on a LineCollection is (curve, point along the curve)
+                k, idx = sel.index
+                idx = int(idx)
+                # the highlight is a copy of the animated collection, it has to be drawn with the rest of the figure
+                for extra in sel.extras:
+                    extra.set_animated(False)
+                label = "m$_f$ = %s" % (mf[k])
+                mf_k = self.simul.atomicsystem.f + int(mf[k])
 
                 label = f"Choice : {label}"
-                idx = int(sel.target.index)
 
-                temp_vec = self.simul.total_vecs[idx, mf]
+                temp_vec = self.simul.total_vecs[idx, mf_k]
                 temp_vec = np.abs(temp_vec) ** 2
                 decomp = f"State : {vec_to_string(temp_vec)}"
 
@@ -265,50 +526,141 @@ class Viz:
                 text = f"{label}\n{textx}\n{texty}\n{decomp}"
                 sel.annotation.set_text(text)
 
+        last_P = None
+
         def updateP(val):
+            nonlocal last_P
+            P = tuple(slider.val * mW for slider in slider_ax)
+            if P == last_P:
+                return
+            last_P = P
+            self.simul.trap.set_powers(list(P))
+            weights = np.array([self.simul.beam_weight(i) for i in range(len(self.simul.trap.beams))], dtype=np.float64)
+
             if dimension == 1:
+                trap_noCP = np.tensordot(weights, pots, axes=1)
+                trap_mf = trap_noCP + cp
+                # a selection is only dropped when the curve moved under it, otherwise its annotation is still right
                 for selection in cursor.selections:
-                    cursor.remove_selection(selection)
-                P = []
-                for (k, slider) in enumerate(slider_ax):
-                    P.append(slider.val * mW)
-                self.simul.trap.set_powers(P)
-                trap = np.real(self.simul.total_potential()) 
-                for k in range(len(mf)):
-                    trap_k = trap[:, mf_index[k]]
-                    a[k].set_ydata(trap_k)
+                    k, idx = selection.index
+                    if not np.isclose(segments[k, int(idx), 1], trap_mf[k, int(idx)]):
+                        cursor.remove_selection(selection)
+                segments[:, :, 1] = trap_mf
+                a.set_segments(segments)
 
                 if len(mf) == 1 and len(self.simul.trap.beams) == 2:
-                    b.set_ydata(
-                        np.real(
-                            self.simul.trap.beams[0].get_power()[0] * np.real(self.simul.potentials[0, :, mf_index[0]])
-                        )
-                    )
-                    r.set_ydata(
-                        np.real(
-                            self.simul.trap.beams[1].get_power()[0] * np.real(self.simul.potentials[1, :, mf_index[0]])
-                        )
-                    )
+                    b.set_ydata(self.simul.trap.beams[0].get_power()[0] * pots[0, 0])
+                    r.set_ydata(self.simul.trap.beams[1].get_power()[0] * pots[1, 0])
 
             elif dimension == 2:
-                P = []
-                for (k, slider) in enumerate(slider_ax):
-                    P.append(slider.val * mW)
-                self.simul.trap.set_powers(P)
-                trap_2D = self.simul.total_potential()[:, :, mf_index]
-                a.set_array(np.transpose(np.real(self.simul.total_potential_noCP[:, :, mf_index])).ravel())
-                a.autoscale()
-                a.set_array(np.transpose(np.real(trap_2D)).ravel())
+                np.dot(weights, pots_flat, out=noCP_buf)
+                np.add(noCP_buf, cp_flat, out=mesh_buf)
+                # the colormap is scaled on the potential without CP, which diverges close to the surface
+                a.norm.autoscale(noCP_buf)
+                a.set_array(mesh_buf)
 
-            fig.canvas.draw_idle()
+            if dimension == 1:
+                blit()
+            else:
+                fig.canvas.draw_idle()
 
+        throttled_updateP = self._throttled(fig, updateP)
         for slider in slider_ax:
-            slider.on_changed(updateP)
+            slider.on_changed(throttled_updateP)
 
         plt.show()
 
         return fig, ax, slider_ax
 
+    @staticmethod
+    def _re(a):
+        """Real part of an array, without any dtype conversion or copy when the array is already real.
+
+        The potentials are stored with a complex dtype by the simulators but the results of
+        Simulation.total_potential are real, so most of the arrays passed here are returned as is.
+        """
+        return a.real if np.iscomplexobj(a) else a
+
+    @staticmethod
+    def _blitter(fig, artists):
+        """Returns a function that only redraws the given artists over a cached background of the figure.
+
+        The artists that change should be created with animated=True, so that they are left out of the background,
+        which is refreshed at each full draw of the figure. Falls back to a full redraw if the backend cannot blit.
+
+        Args:
+            fig (Figure): figure containing the artists.
+            artists (list): artists (lines, axes) redrawn at each call.
+
+        Returns:
+            function: to be called after the data of the artists has been updated.
+        """
+        if not fig.canvas.supports_blit:
+            for artist in artists:
+                artist.set_animated(False)
+            return fig.canvas.draw_idle
+
+        background = None
+
+        def on_draw(event):
+            nonlocal background
+            background = fig.canvas.copy_from_bbox(fig.bbox)
+            for artist in artists:
+                fig.draw_artist(artist)
+
+        def blit():
+            if background is None:
+                fig.canvas.draw_idle()
+                return
+            fig.canvas.restore_region(background)
+            for artist in artists:
+                fig.draw_artist(artist)
+            fig.canvas.blit(fig.bbox)
+
+        fig.canvas.mpl_connect("draw_event", on_draw)
+        return blit
+
+    @staticmethod
+    def _throttled(fig, callback, interval=50):
+        """Wraps a slider callback so that it runs at most once every interval (in ms).
+
+        The values received in between are coalesced: the callback is run once with the last one when the timer of the
+        figure canvas fires. As this happens after the draw requested by the slider itself, the callback has to redraw
+        the artists it updated (blit or draw_idle), otherwise they only show up at the next unrelated draw.
+        Non-interactive canvases (Agg, ...) only provide a timer that never fires, the callback is then returned as is.
+
+        Args:
+            fig (Figure): figure whose canvas provides the timer.
+            callback (function): slider callback, taking the slider value.
+            interval (int): minimum time between two calls of the callback (ms). Defaults to 50.
+
+        Returns:
+            function: callback to connect to the sliders.
+        """
+        timer = fig.canvas.new_timer(interval=interval)
+        if type(timer) is TimerBase:
+            return callback
+        timer.single_shot = True
+        pending = False
+        last_val = None
+
+        def do_update():
+            nonlocal pending
+            pending = False
+            callback(last_val)
+
+        timer.add_callback(do_update)
+
+        def request_update(val):
+            nonlocal pending, last_val
+            last_val = val
+            if pending:
+                return
+            pending = True
+            timer.start()
+
+        return request_update
+
     def restrict_trap_from_surfaces(self, mf=0):
         """Returns the truncation of both the specified axis and the trap along that direction, setting 0 for the coordinate at the edge of the structure.
 
@@ -339,7 +691,9 @@ class Viz:
 
         self.simul.geometry = self.trapping_axis
         coord_main = self.trapping_axis.fetch_in(self.simul)
-        trap_main = np.real(self.simul.compute())[0][:, mf_index]
+        self.simul.compute()
+        # only the contiguous trap of the mf state is summed, instead of slicing a column of the full total potential
+        trap_main = self.simul.total_potential(mf_index=mf_index)
 
         # self.simul.geometry = self.trapping_axis.normal_plane.get_base_axes()[0]
         # coord_1 = self.simul.geometry.fetch_in(self.simul)
@@ -358,6 +712,26 @@ class Viz:
 
         # return mf_index, edge, y_outside, trap_outside
 
+    def _compute_1D_trap(self, axis, mf_index):
+        """Computes the trap along a 1D axis for one mf state, then restores the geometry of the simulation.
+
+        The computation goes through the geometry, potentials and CP attributes of the shared Simulation object,
+        so the traps along the different axes have to be computed one after the other, on the thread of the figure.
+
+        Args:
+            axis (Axis): 1D geometry along which the trap is computed.
+            mf_index (int): Index of the mf state in the potentials.
+
+        Returns:
+            array: 1D trap along the axis.
+        """
+        old_geometry = copy(self.simul.geometry)
+        self.simul.geometry = axis
+        self.simul.compute()
+        trap = self.simul.total_potential(mf_index=mf_index)
+        self.simul.geometry = old_geometry
+        return trap
+
     def plot_3axis(self, mf=0, Pranges=[10, 10], increments=[0.1, 0.1]):
         """Shows 3 1D plots of the total potential with power sliders,
         and trapping frequencies for each axis if possible.
@@ -398,7 +772,10 @@ class Viz:
         axis_name_list = [main_axis.name, axis1.name, axis2.name]
 
         main_axis_data = main_axis.fetch_in(self.simul)
+        # the orthogonal axes always span the full coordinates of the simulation, they are resolved once for all the updates
         axis1_data, axis2_data = np.reshape(axis1.fetch_in(self.simul),-1), np.reshape(axis2.fetch_in(self.simul),-1)
+        index_1 = _nearest(axis1_data, main_axis.coordinates[0])
+        index_2 = _nearest(axis2_data, main_axis.coordinates[1])
 
         if len(self.simul.E[0].shape) != 4:
             print("[WARNING] 3D Electric fields must be fed in the Simulation class in order to use this function")
@@ -407,7 +784,8 @@ class Viz:
             #     mf=mf
             # )
             y_out_main, trap_out_main = self.restrict_trap_from_surfaces(mf=mf)
-            ymin_ind, y_min, trap_depth, trap_prominence, _ = self.get_min_trap(y_out_main, trap_out_main)
+            min_main = self.get_min_trap(y_out_main, trap_out_main)
+            ymin_ind, y_min, trap_depth, trap_prominence, _ = min_main
 
             omega_1, omega_main, omega_2 = 0, 0, 0
             if not np.isnan(y_min):
@@ -417,28 +795,19 @@ class Viz:
                 # min_pos[axis2.index] = main_axis.coordinates[1]
 
                 ax1, ax2 = self.trapping_axis.complete_orthogonal_basis(position=y_min)
-                old_geometry = copy(self.simul.geometry)
-
-                self.simul.geometry = ax1
-                y_out_1 = self.simul.geometry.fetch_in(self.simul)
-                trap_out_1 = np.real(self.simul.compute())[0][:, mf_index]
-                omega_1 = self.get_trapfreq(y_out_1, trap_out_1)
-
-                self.simul.geometry = ax2
-                y_out_2 = self.simul.geometry.fetch_in(self.simul)
-                trap_out_2 = np.real(self.simul.compute())[0][:, mf_index]
-                omega_2 = self.get_trapfreq(y_out_2, trap_out_2)
+                trap_out_1 = self._compute_1D_trap(ax1, mf_index)
+                omega_1 = self.get_trapfreq(axis1_data, trap_out_1, axis=ax1)
+                trap_out_2 = self._compute_1D_trap(ax2, mf_index)
+                omega_2 = self.get_trapfreq(axis2_data, trap_out_2, axis=ax2)
 
-                self.simul.geometry = old_geometry
-
-                omega_main = self.get_trapfreq(y_out_main, trap_out_main)
+                omega_main = self.get_trapfreq(y_out_main, trap_out_main, precomputed_min=min_main)
 
                 # omega_1 = self.get_trapfreq(y_out_1, trap_out_1)
 
                 # omega_2 = self.get_trapfreq(y_out_2, trap_out_2)
 
             fig, ax = plt.subplots(3, figsize=(15, 10))
-            plt.subplots_adjust(left=0.25)
+            fig.subplots_adjust(left=0.25)
             axcolor = "lightgoldenrodyellow"
             props = dict(boxstyle="round", facecolor=axcolor, alpha=0.5)
 
@@ -464,14 +833,21 @@ class Viz:
                 )
             )
 
-            box = plt.text(
-                -0.3, 0.6, textstr, transform=ax[2].transAxes, fontsize=14, verticalalignment="top", bbox=props
+            box = ax[2].text(
+                -0.3,
+                0.6,
+                textstr,
+                transform=ax[2].transAxes,
+                fontsize=14,
+                verticalalignment="top",
+                bbox=props,
+                animated=True,
             )
 
             slider_ax = []
             axes = []
             for (k, beam) in enumerate(self.simul.trap.beams):
-                axes.append(plt.axes([0.1 + k * 0.05, 0.32, 0.03, 0.5], facecolor=axcolor))
+                axes.append(fig.add_axes([0.1 + k * 0.05, 0.32, 0.03, 0.5], facecolor=axcolor))
                 print(self.simul.trap.beams[k].get_power())
                 slider_ax.append(
                     Slider(
@@ -484,24 +860,29 @@ class Viz:
                         orientation="vertical",
                     )
                 )
+                # the sliders are redrawn with the curves by the blitting below
+                slider_ax[k].drawon = False
 
-            index_1 = np.argmin(np.abs(axis1_data - main_axis.coordinates[0]))
-            index_2 = np.argmin(np.abs(axis2_data - main_axis.coordinates[1]))
-
-            (ly,) = ax[0].plot(y_out_main, trap_out_main, linewidth=3, color="darkblue")
+            (ly,) = ax[0].plot(y_out_main, trap_out_main, linewidth=3, color="darkblue", animated=True)
             ax[0].set_ylim([-2, 2])
             if not np.isnan(y_min):
-                (point,) = ax[0].plot(y_out_main[int(ymin_ind)], trap_out_main[int(ymin_ind)], "ro")
-                (lx,) = ax[1].plot(axis1_data, trap_out_1, linewidth=2, color="royalblue")
-                (lz,) = ax[2].plot(axis2_data, trap_out_2, linewidth=2, color="royalblue")
-                (point1,) = ax[1].plot(axis1_data[index_1], trap_out_1[index_1], "ro")
-                (point2,) = ax[2].plot(axis2_data[index_2], trap_out_2[index_2], "ro")
+                (point,) = ax[0].plot(y_out_main[int(ymin_ind)], trap_out_main[int(ymin_ind)], "ro", animated=True)
+                (lx,) = ax[1].plot(axis1_data, trap_out_1, linewidth=2, color="royalblue", animated=True)
+                (lz,) = ax[2].plot(axis2_data, trap_out_2, linewidth=2, color="royalblue", animated=True)
+                (point1,) = ax[1].plot(axis1_data[index_1], trap_out_1[index_1], "ro", animated=True)
+                (point2,) = ax[2].plot(axis2_data[index_2], trap_out_2[index_2], "ro", animated=True)
+                points = [point, point1, point2]
 
             else:
-                (lx,) = ax[1].plot(axis1_data, np.zeros((len(axis1_data),)), linewidth=2, color="royalblue")
-                (lz,) = ax[2].plot(axis2_data, np.zeros((len(axis2_data),)), linewidth=2, color="royalblue")
+                (lx,) = ax[1].plot(
+                    axis1_data, np.zeros((len(axis1_data),)), linewidth=2, color="royalblue", animated=True
+                )
+                (lz,) = ax[2].plot(
+                    axis2_data, np.zeros((len(axis2_data),)), linewidth=2, color="royalblue", animated=True
+                )
+                points = []
 
-            plt.grid(alpha=0.5)
+            ax[2].grid(alpha=0.5)
             for k in range(len(ax)):
                 ax[k].set_xlabel("%s (m)" % (axis_name_list[k].lower()), fontsize=14)
                 plt.setp(ax[k].spines.values(), linewidth=2)
@@ -511,30 +892,45 @@ class Viz:
 
             fig.text(0.21, 0.5, "Potential (mK)", ha="center", va="center", rotation="vertical", fontsize=14)
 
+            blit = self._blitter(fig, [ly, lx, lz, box] + points + axes)
+
+            # the limits of the axes are only moved when the traps get out of them by more than 5% of their span,
+            # the other updates only blit the curves instead of redrawing the whole figure
+            ylims = [ax[k].get_ylim() for k in range(len(ax))]
+
+            def update_ylim(k, lo, hi):
+                old_lo, old_hi = ylims[k]
+                tol = 0.05 * abs(old_hi - old_lo)
+                if abs(lo - old_lo) <= tol and abs(hi - old_hi) <= tol:
+                    return False
+                ylims[k] = (lo, hi)
+                ax[k].set_ylim([lo, hi])
+                return True
+
+            last_P = None
+
             def updateP(val):
-                P = [slider.val * mW for (k, slider) in enumerate(slider_ax)]
-                self.simul.trap.set_powers(P)
+                nonlocal last_P
+                P = tuple(slider.val * mW for slider in slider_ax)
+                # several events can be emitted for the same slider values, the traps are only recomputed when they change
+                if P == last_P:
+                    return
+                last_P = P
+                self.simul.trap.set_powers(list(P))
                 y_out_main, trap_out_main = self.restrict_trap_from_surfaces(mf=mf)
-                ymin_ind, y_min, trap_depth, trap_prominence, _ = self.get_min_trap(y_out_main, trap_out_main)
+                min_main = self.get_min_trap(y_out_main, trap_out_main)
+                ymin_ind, y_min, trap_depth, trap_prominence, _ = min_main
 
                 omega_1, omega_main, omega_2 = 0, 0, 0
+                ylim_changed = False
                 if not np.isnan(y_min):
                     ax1, ax2 = self.trapping_axis.complete_orthogonal_basis(position=y_min)
-                    old_geometry = copy(self.simul.geometry)
+                    trap_out_1 = self._compute_1D_trap(ax1, mf_index)
+                    omega_1 = self.get_trapfreq(axis1_data, trap_out_1, axis=ax1)
+                    trap_out_2 = self._compute_1D_trap(ax2, mf_index)
+                    omega_2 = self.get_trapfreq(axis2_data, trap_out_2, axis=ax2)
 
-                    self.simul.geometry = ax1
-                    y_out_1 = self.simul.geometry.fetch_in(self.simul)
-                    trap_out_1 = np.real(self.simul.compute())[0][:, mf_index]
-                    omega_1 = self.get_trapfreq(y_out_1, trap_out_1)
-
-                    self.simul.geometry = ax2
-                    y_out_2 = self.simul.geometry.fetch_in(self.simul)
-                    trap_out_2 = np.real(self.simul.compute())[0][:, mf_index]
-                    omega_2 = self.get_trapfreq(y_out_2, trap_out_2)
-
-                    self.simul.geometry = old_geometry
-
-                    omega_main = self.get_trapfreq(y_out_main, trap_out_main)
+                    omega_main = self.get_trapfreq(y_out_main, trap_out_main, precomputed_min=min_main)
 
                     lx.set_ydata(trap_out_1)
                     lz.set_ydata(trap_out_2)
@@ -542,9 +938,9 @@ class Viz:
                     point1.set_data(axis1_data[index_1], trap_out_1[index_1])
                     point2.set_data(axis2_data[index_2], trap_out_2[index_2])
 
-                    ax[1].set_ylim([trap_out_1.min(), trap_out_1.max()])
-                    ax[2].set_ylim([trap_out_2.min(), trap_out_2.max()])
-                    ax[0].set_ylim([2 * trap_depth, 2 * trap_out_main.max()])
+                    ylim_changed |= update_ylim(1, trap_out_1.min(), trap_out_1.max())
+                    ylim_changed |= update_ylim(2, trap_out_2.min(), trap_out_2.max())
+                    ylim_changed |= update_ylim(0, 2 * trap_depth, 2 * trap_out_main.max())
 
                     textstr = "\n".join(
                         (
@@ -572,10 +968,16 @@ class Viz:
                     textstr = r"$\mathrm{depth}=%.2f (mK) $" % (trap_depth,)
 
                 box.set_text(textstr)
-                ly.set_ydata(np.squeeze(np.real(trap_out_main)))
+                ly.set_ydata(np.squeeze(self._re(trap_out_main)))
 
+                if ylim_changed:
+                    fig.canvas.draw_idle()
+                else:
+                    blit()
+
+            throttled_updateP = self._throttled(fig, updateP)
             for slider in slider_ax:
-                slider.on_changed(updateP)
+                slider.on_changed(throttled_updateP)
             plt.show()
             return fig, ax, slider_ax
 
@@ -610,55 +1012,58 @@ class Viz:
         
         # l = len(y_outside)
         if edge_no_surface is not None:
-            threshold = np.argmin(np.abs(y_outside - (edge_no_surface + 30e-9))) #no closer than 30 nm
+            threshold = _nearest(y_outside, edge_no_surface + 30e-9) #no closer than 30 nm
         else : 
             threshold = 0
         # print("threshold :", threshold)
         # threshold = int(0.08*l) #8% of the whole range of y
         if np.ndim(trap_outside) >= 3:
             raise TypeError("This method can only be used if a 1D computation of the potential has been done.")
-        local_minima = find_peaks(-trap_outside, distance=10, prominence=1e-5)
-        # print(local_minima)
-        if len(local_minima[0]) == 0:
+        if _USE_FIND_PEAKS:
+            from scipy.signal import find_peaks
+
+            peaks, properties = find_peaks(-trap_outside, distance=10, prominence=1e-5)
+            n_minima = len(peaks)
+            best = _select_minimum(peaks, properties["prominences"], threshold)
+            if best >= 0:
+                idx, prominence, left_base = peaks[best], properties["prominences"][best], properties["left_bases"][best]
+        else:
+            n_minima, idx, prominence, left_base = _lowest_minimum(
+                np.ascontiguousarray(trap_outside, dtype=np.float64), 10, 1e-5, threshold
+            )
+            best = idx
+        if n_minima == 0:
             verboseprint("[WARNING] No local minimum found")
             return np.nan, np.nan, 0, 0, np.nan
-        elif len(local_minima[0]) == 1 and local_minima[0][0] > threshold:
-            verboseprint("[INFO] One local miminum found at %s" % (y_outside[local_minima[0][0]]))
-            return (
-                local_minima[0][0],
-                y_outside[local_minima[0][0]],
-                trap_outside[local_minima[0][0]],
-                -local_minima[1]["prominences"][0],
-                local_minima[1]["left_bases"][0],
-            )
-        elif len(local_minima[0]) == 1 and local_minima[0][0] <= threshold:
+        elif best < 0 and n_minima == 1:
             verboseprint("[WARNING] One local minimum found but too close to the edge of the structure")
             return np.nan, np.nan, 0, 0, np.nan
+        elif best < 0:
+            verboseprint("[WARNING] Many local minima found but none above the threshold")
+            return np.nan, np.nan, 0, 0, np.nan
+        elif n_minima == 1:
+            verboseprint("[INFO] One local miminum found at %s" % (y_outside[idx]))
+            return (
+                idx,
+                y_outside[idx],
+                trap_outside[idx],
+                -prominence,
+                left_base,
+            )
         else:
-            args = local_minima[0]
-            prom = local_minima[1]["prominences"][args > threshold]
-            base = local_minima[1]["left_bases"][args > threshold]
-            args = args[args > threshold] #Removing the ones too close to the surface
-            verboseprint(args)
-            try :
-                args = [args[np.argmax(prom)]]
-            except : 
-                ValueError("[WARNING] Many local minima found but none above the threshold")
-                return np.nan, np.nan, 0, 0, np.nan
-            # print(args)
             verboseprint(
                 "[WARNING] Many local minima found, taking only the biggest one into account at %s"
-                % (y_outside[args[0]])
+                % (y_outside[idx])
             )
             return (
-                args[0],
-                y_outside[args[0]],
-                trap_outside[args[0]],
-                prom[0],
-                base[0],
+                idx,
+                y_outside[idx],
+                trap_outside[idx],
+                prominence,
+                left_base,
             )
 
-    def get_trapfreq(self, y_outside, trap_outside, edge_no_surface=None, fit_range=None):
+    def get_trapfreq(self, y_outside, trap_outside, edge_no_surface=None, fit_range=None, precomputed_min=None, axis=None):
         """Finds the value of the trapping frequency (in Hz) along the specified axis
 
         Args:
@@ -667,6 +1072,8 @@ class Viz:
             mf (int or list): Mixed mf state we want to analyze. Default to 0.
             edge_no_surface (float): Position of the edge of the structure. Only needed when no Surface is specified. When a Surface object is given, it is found automatically with the CP masks. Defaults to None.
             fit_range (float) : width (in points) for the quadratic fit around the trap minimum. If not specified, the range is taken as half the distance between the trap position and the peak base. 
+            precomputed_min (tuple): output of get_min_trap for the same trap, if already available, to avoid searching the minimum twice. Defaults to None.
+            axis (Axis): 1D geometry along which the trap was computed, a trap along x being taken as periodic when no minimum is found. Defaults to None, for the current geometry of the simulation.
         Raise:
             TypeError: if only a 2D computation of the potential has been done before plotting.
 
@@ -677,13 +1084,26 @@ class Viz:
         if np.ndim(trap_outside) >= 3:
             raise TypeError("The trap given must be one-dimensional")
 
-        min_pos_index, min_pos, depth, height, height_idx = self.get_min_trap(y_outside, trap_outside, edge_no_surface, False)
-        # print(min_pos, height_idx)
-        if np.isnan(min_pos) and self.simul.geometry.name == 'x':
-            trap_outside3 = np.concatenate((trap_outside, trap_outside, trap_outside))
-            y_outside3 = np.concatenate(
-                (y_outside - (y_outside[-1] - y_outside[0]), y_outside, y_outside + (y_outside[-1] - y_outside[0]))
+        if precomputed_min is not None:
+            min_pos_index, min_pos, depth, height, height_idx = precomputed_min
+        else:
+            min_pos_index, min_pos, depth, height, height_idx = self.get_min_trap(
+                y_outside, trap_outside, edge_no_surface, False
             )
+        # print(min_pos, height_idx)
+        axis_name = (self.simul.geometry if axis is None else axis).name
+        if np.isnan(min_pos) and axis_name == 'x':
+            N = len(trap_outside)
+            # the trap buffer follows the dtype of the trap, which may be complex
+            trap_dtype = np.result_type(trap_outside, np.float64)
+            if self._tile_buf_t is None or len(self._tile_buf_t) != 3 * N or self._tile_buf_t.dtype != trap_dtype:
+                self._tile_buf_y = np.empty(3 * N)
+                self._tile_buf_t = np.empty(3 * N, dtype=trap_dtype)
+            period = y_outside[-1] - y_outside[0]
+            y_outside3, trap_outside3 = self._tile_buf_y, self._tile_buf_t
+            for k in range(3):
+                np.copyto(trap_outside3[k * N : (k + 1) * N], trap_outside)
+                np.add(y_outside, (k - 1) * period, out=y_outside3[k * N : (k + 1) * N])
             min_pos_index, min_pos, depth, height, height_idx = self.get_min_trap(
                 y_outside3, trap_outside3, edge_no_surface
             )
@@ -692,30 +1112,30 @@ class Viz:
                 return 0
             else:
                 pass
-        elif np.isnan(min_pos) and self.simul.geometry.name != 'x':
+        elif np.isnan(min_pos) and axis_name != 'x':
             return 0
         
         height_pos = y_outside[height_idx]  ## Gives the position of the barrier
         yleft = min_pos - (min_pos - height_pos) / 2
         yright = min_pos + (min_pos - height_pos) / 2
                 
-        idx_left = find_nearest(y_outside, yleft)
-        idx_right = find_nearest(y_outside, yright)
+        idx_left = _nearest(y_outside, yleft)
+        idx_right = _nearest(y_outside, yright)
         
         if fit_range != None :
-            idx_left = min_pos_index - fit_range
-            idx_right = min_pos_index + fit_range
+            idx_left = max(0, min_pos_index - fit_range)
+            idx_right = min(len(y_outside), min_pos_index + fit_range + 1)
         
         if idx_right == idx_left:
             return 0
         # print(idx_right, idx_left)
-        fit = np.polyfit(y_outside[idx_left:idx_right], trap_outside[idx_left:idx_right], 2)
-
-        p = np.poly1d(fit)
-        der_fit = np.real(np.gradient(p(y_outside), y_outside))
-        der2_fit = np.gradient(der_fit, y_outside)
-        index_min = np.argmin(np.abs(y_outside - min_pos))
-        moment2 = der2_fit[index_min+1]
+        # curvature of the local quadratic fit a*y**2 + b*y + c around the minimum, 2a, solved in closed form
+        moment2 = _quadratic_curvature(
+            np.ascontiguousarray(y_outside[idx_left:idx_right], dtype=np.float64),
+            np.ascontiguousarray(self._re(trap_outside[idx_left:idx_right]), dtype=np.float64),
+        )
+        if np.isnan(moment2):
+            return 0
         trap_freq = np.sqrt((moment2 * kB * mK) / (self.simul.atomicsystem.mass)) * (1 / (2 * np.pi))
         return trap_freq
     
@@ -762,11 +1182,9 @@ class Viz:
     def ellipticity_plot(self, projection_axis):
         if self.simul.dimension == "2D":
             projection_axis_index = set_axis_index(projection_axis)
-            E_amp = np.sqrt(np.sum(abs(self.simul.Etot) ** 2, axis=0))
-            E_amp3 = np.stack((E_amp, E_amp, E_amp))
-            E_norm = self.simul.Etot / E_amp3
-            C = np.cross(E_norm, np.conjugate(E_norm), axisa=0, axisb=0, axisc=0)
-            Cz = np.imag(C[projection_axis_index])
+            E_amp = np.linalg.norm(self.simul.Etot, axis=0, keepdims=True)
+            E_norm = self.simul.Etot / E_amp
+            Cz = _cross_conj_imag(E_norm, projection_axis_index)
             fig, ax = plt.subplots()
             pcm = ax.pcolormesh(
                 self.simul.coord1,
@@ -781,83 +1199,191 @@ class Viz:
             plt.title("Ellipticity")
 
         elif self.simul.dimension == "1D":
-            C = np.cross(self.simul.Etot, np.conjugate(self.simul.Etot), axisa=0, axisb=0, axisc=0)
             normal_axis_index = set_axis_index(set_normal_axis(self.simul.plane))
-            Cz = np.imag(C[normal_axis_index])
+            Cz = _cross_conj_imag(self.simul.Etot, normal_axis_index)
             fig, ax = plt.subplots()
             pcm = plt.plot(self.simul.coord, Cz)
             plt.title("Ellipticity")
         return Cz
 
-    def optimize(self, ymin=0, Pmin1=0, Pmax1=10, Pstep1=1, Pmin2=0, Pmax2=10, Pstep2=1, mf = 0):
+    def _power_basis(self, yidx, mf_index):
+        """Decomposes the 1D trap used by optimize as U0 + P1 * U1 + P2 * U2.
+
+        The potential of each beam being proportional to its power, the trap for any powers (P1, P2) is
+        obtained from three evaluations of total_potential. The decomposition is kept until the potentials
+        are recomputed.
+
+        Args:
+            yidx (int): Index of the first coordinate of the trap.
+            mf_index (int): Index of the mf state in the potentials.
+
+        Raise:
+            ValueError: if the trap is not linear in the beam powers.
+
+        Returns:
+            (tuple): containing the arrays U0 (CP term), U1 and U2 (trap of each beam for 1 W).
+        """
+        cache = self._power_basis_cache
+        if (
+            cache is not None
+            and cache[0] is self.simul.potentials
+            and cache[1] is self.simul.CP
+            and cache[2] == (yidx, mf_index)
+        ):
+            return cache[3]
+
+        # all the powers of each beam are kept, a BeamPair may have different forward and backward powers
+        old_powers = [np.copy(beam.get_power()) for beam in self.simul.trap.beams]
+
+        def trap_at(P1, P2):
+            self.simul.trap.set_powers([P1, P2])
+            return np.array(self._re(self.simul.total_potential()[0, yidx:, mf_index]), dtype=np.float64)
+
+        try:
+            # float probes, BeamSum.set_power only takes a float or one power per beam
+            U0 = trap_at(0.0, 0.0)
+            U1 = trap_at(1.0, 0.0) - U0
+            U2 = trap_at(0.0, 1.0) - U0
+            if not np.allclose(trap_at(1.0, 1.0), U0 + U1 + U2):
+                raise ValueError("The trap is not linear in the beam powers, it cannot be decomposed on the beams")
+        finally:
+            for beam, power in zip(self.simul.trap.beams, old_powers):
+                if beam.isBeamSum():
+                    beam.set_power(power)
+                else:
+                    beam.set_power(*power)
+
+        self._power_basis_cache = (self.simul.potentials, self.simul.CP, (yidx, mf_index), (U0, U1, U2))
+        return U0, U1, U2
+
+    def optimize(
+        self, ymin=0, Pmin1=0, Pmax1=10, Pstep1=1, Pmin2=0, Pmax2=10, Pstep2=1, mf = 0, n_jobs=-1, refine=False, n_refine=4
+    ):
+        """Analyses the 1D trap of the current geometry for all the powers of a grid, for a trap made of two beams.
+
+        The results are kept for the last calls and returned again as long as the potentials are not recomputed.
+
+        Args:
+            ymin (float): Coordinate from which the trap is analysed (m). Defaults to 0.
+            Pmin1 (float): Minimal power of the first beam (W). Defaults to 0.
+            Pmax1 (float): Maximal power of the first beam, excluded (W). Defaults to 10.
+            Pstep1 (float): Power step of the first beam (W). Defaults to 1.
+            Pmin2 (float): Minimal power of the second beam (W). Defaults to 0.
+            Pmax2 (float): Maximal power of the second beam, excluded (W). Defaults to 10.
+            Pstep2 (float): Power step of the second beam (W). Defaults to 1.
+            mf (int): Mixed mf state we want to analyze. Default to 0.
+            n_jobs (int): Number of threads the points of each row of the grid are spread over, -1 for all of them. Defaults to -1.
+            refine (bool): If True, the grid is first computed with a stride of 4 and interpolated, and the full resolution is only computed around the highest maxima of the barrier. Defaults to False.
+            n_refine (int): Number of maxima of the coarse barrier around which the grid is refined. Only used if refine is True. Defaults to 4.
+
+        Raise:
+            ValueError: if the trap is not linear in the beam powers.
+
+        Returns:
+            (tuple): containing, the arrays of results having shape (len(Prange1), len(Prange2)):
+
+                - array: Position of the trap minimum (nm).
+                - array: Depth of the trap (mK).
+                - array: Height of the barrier around the minimum, i.e. its prominence (mK).
+                - array: Trapping frequency (kHz).
+                - array: Prange1, powers of the first beam, in decreasing order (W).
+                - array: Prange2, powers of the second beam (W).
+        """
         _, mf = check_mf(self.simul.atomicsystem.f, mf)
         mf_index = int(mf + self.simul.atomicsystem.f)
-        Prange1 = list(reversed(np.arange(Pmin1, Pmax1, Pstep1)))
-        Prange2 = np.arange(Pmin2, Pmax2, Pstep2)
 
-        res_pos = np.zeros((len(Prange1), len(Prange2)))
-        res_depth = np.zeros((len(Prange1), len(Prange2)))
-        res_height = np.zeros((len(Prange1), len(Prange2)))
-        res_freq = np.zeros((len(Prange1), len(Prange2)))
+        source = self._optimize_cache_source
+        if source is None or source[0] is not self.simul.potentials or source[1] is not self.simul.CP:
+            self._optimize_cache.clear()
+            self._optimize_cache_source = (self.simul.potentials, self.simul.CP)
+        key = (self.simul.geometry.name, ymin, Pmin1, Pmax1, Pstep1, Pmin2, Pmax2, Pstep2, mf_index, refine, n_refine)
+        if key in self._optimize_cache:
+            self._optimize_cache.move_to_end(key)
+            return tuple(np.copy(res) for res in self._optimize_cache[key])
+
+        Prange1 = np.arange(Pmin1, Pmax1, Pstep1, dtype=np.float64)[::-1]
+        Prange2 = np.arange(Pmin2, Pmax2, Pstep2, dtype=np.float64)
+        n1, n2 = len(Prange1), len(Prange2)
 
         yidx = find_nearest(self.simul.geometry.fetch_in(self.simul), ymin)
         yout = self.simul.geometry.fetch_in(self.simul)[yidx:]
 
-        for i, P1 in progressbar_enumerate(Prange1, "\n Optimizing: ", 40):
-        # for i, P1 in enumerate(Prange1):
-            for j, P2 in enumerate(Prange2):
-                # for i, P1 in enumerate(Prange):
-                #     for j, P2 in enumerate(Prange):
-                self.simul.trap.set_powers([P1, P2])
-                pot = np.real(self.simul.total_potential()[0, yidx:, mf_index])
-                min_idx, min_pos, depth, height, height_idx = self.get_min_trap(yout, pot)
-                # sys.stdout.write("depth")
-                ######### frequencies
-                if np.isnan(height_idx):
-                    trap_freq = 0
-                else:
-                    try :
-                        height_pos = yout[height_idx]  ## Gives the position of the barrier
-                        yleft = min_pos - (min_pos - height_pos) / 2
-                        yright = min_pos + (min_pos - height_pos) / 2
-                        idx_left = find_nearest(yout, yleft)
-                        idx_right = find_nearest(yout, yright)
-                        fit = np.polyfit(yout[idx_left:idx_right], pot[idx_left:idx_right], 2)
-    
-                        p = np.poly1d(fit)
-                        yinterp = np.linspace(yout[0], yout[-1], 500)
-                        der_fit = np.real(np.gradient(p(yinterp), yinterp))
-                        der2_fit = np.gradient(der_fit, yinterp)
-                        index_min = np.argmin(np.abs(yinterp - min_pos))
-                        moment2 = der2_fit[index_min]
-                        trap_freq = np.sqrt((moment2 * kB * mK) / (self.simul.atomicsystem.mass)) * (1 / (2 * np.pi)) / kHz
-                    except :
-                        trap_freq = 0
-                ##################
-
-                if abs(depth) > 10:
-                    depth = 0
-                if abs(height) > 10:
-                    height = 0
-
-                depth = abs(depth)
-                height = abs(height)
-                res_pos[i, j] = min_pos
-                res_depth[i, j] = depth
-                res_height[i, j] = height
-                res_freq[i, j] = trap_freq
-
-        nan_to_zeros(res_pos, res_height, res_depth, res_freq)
-        res_pos *= 1e9
+        # the traps are rebuilt from the trap of each beam and analysed by a compiled kernel, one row of the grid at a
+        # time, the points of a row being spread over n_jobs threads
+        U0, U1, U2 = self._power_basis(yidx, mf_index)
+        yout = np.ascontiguousarray(yout, dtype=np.float64)
+        # conversion from the square root of the trap curvature (mK/m^2) to the trapping frequency (kHz)
+        C_freq = np.sqrt(kB * mK / self.simul.atomicsystem.mass) * (1 / (2 * np.pi)) / kHz
+
+        def sweep(rows, cols):
+            # position, depth, height and frequency on the sub-grid Prange1[rows] x Prange2[cols]
+            P2 = np.ascontiguousarray(Prange2[cols])
+            # scratch traps of one row, reused by all the rows of the grid
+            pot_buf = np.empty((len(P2), len(yout)))
+            res = np.zeros((4, len(rows), len(P2)))
+            for k, i in progressbar_enumerate(rows, "\n Optimizing: ", 40):
+                _sweep_row(Prange1[i], P2, U0, U1, U2, yout, C_freq, pot_buf, res[0, k], res[1, k], res[2, k], res[3, k])
+            # depths and heights above 10 mK are not physical, they are discarded
+            res[1:3] = np.where(np.abs(res[1:3]) > 10, 0.0, np.abs(res[1:3]))
+            nan_to_zeros(res)
+            return res
+
+        default_threads = numba.get_num_threads()
+        max_threads = numba.config.NUMBA_NUM_THREADS
+        numba.set_num_threads(max_threads if n_jobs == -1 else max(1, min(n_jobs, max_threads)))
+        try:
+            if refine:
+                # coarse grid with a stride of 4 (keeping the last powers), bilinearly interpolated on the full grid,
+                # then the full resolution is computed only around the n_refine highest local maxima of the barrier
+                rows = np.unique(np.append(np.arange(0, n1, 4), n1 - 1))
+                cols = np.unique(np.append(np.arange(0, n2, 4), n2 - 1))
+                coarse = sweep(rows, cols)
+                res = np.empty((4, n1, n2))
+                for q in range(4):
+                    along_cols = np.array([np.interp(np.arange(n2), cols, line) for line in coarse[q]])
+                    res[q] = np.array([np.interp(np.arange(n1), rows, line) for line in along_cols.T]).T
+
+                height = coarse[2]
+                neighbours = np.pad(height, 1, constant_values=-np.inf)
+                neighbours = np.max(
+                    [neighbours[a : a + len(rows), b : b + len(cols)] for a in range(3) for b in range(3)], axis=0
+                )
+                maxima = np.argwhere((height == neighbours) & (height > 0))
+                maxima = maxima[np.argsort(height[maxima[:, 0], maxima[:, 1]])[::-1][:n_refine]]
+                for a, b in maxima:
+                    r0, r1 = rows[max(a - 1, 0)], rows[min(a + 1, len(rows) - 1)] + 1
+                    c0, c1 = cols[max(b - 1, 0)], cols[min(b + 1, len(cols) - 1)] + 1
+                    res[:, r0:r1, c0:c1] = sweep(np.arange(r0, r1), np.arange(c0, c1))
+            else:
+                res = sweep(np.arange(n1), np.arange(n2))
+        finally:
+            numba.set_num_threads(default_threads)
 
-        return res_pos, res_depth, res_height, res_freq
+        res_pos, res_depth, res_height, res_freq = res
+        res_pos *= 1e9
 
-    def optimize_and_show(self, ymin=0, Pmin1=0, Pmax1=10, Pstep1=1, Pmin2=0, Pmax2=10, Pstep2=1, mf = 0):
+        self._optimize_cache[key] = (res_pos, res_depth, res_height, res_freq, Prange1, Prange2)
+        if len(self._optimize_cache) > 8:
+            self._optimize_cache.popitem(last=False)
+        return tuple(np.copy(res) for res in self._optimize_cache[key])
+
+    @staticmethod
+    def _opt_on_add(sel):
+        """Annotation of the optimal powers line of optimize_and_show."""
+        x, y = sel.target
+        textx = f"P2 = {x:.1f} nm"
+        texty = f"P1 = {y:.2f} mK"
+        text = f"{textx}\n{texty}"
+        sel.annotation.set_text(text)
+
+    def optimize_and_show(
+        self, ymin=0, Pmin1=0, Pmax1=10, Pstep1=1, Pmin2=0, Pmax2=10, Pstep2=1, mf = 0, interp_method="nearest"
+    ):
         ################################################################################################################
         ############################################ Optimization procedure ############################################
         ################################################################################################################
         # blockPrint()
-        opt_pos, opt_depth, opt_height, opt_freq = self.optimize(
+        opt_pos, opt_depth, opt_height, opt_freq, Prange1, Prange2 = self.optimize(
             ymin=ymin, Pmin1=Pmin1, Pmax1=Pmax1, Pstep1=Pstep1, Pmin2=Pmin2, Pmax2=Pmax2, Pstep2=Pstep2, mf = mf
         )
         # enablePrint()
@@ -887,10 +1413,6 @@ class Viz:
 
         color_map = "coolwarm"  # "viridis"  # "gnuplot2"
 
-        Prange1 = list(reversed(np.arange(Pmin1, Pmax1, Pstep1)))
-        Prange1 = np.asarray(Prange1)
-        Prange2 = np.arange(Pmin2, Pmax2, Pstep2)
-
         # ax1 = plt.subplot(223)
         # im1 = ax1.imshow(
         #     opt_pos,
@@ -912,10 +1434,11 @@ class Viz:
         im4 = ax4.imshow(
             opt_freq,
             cmap=color_map,
-            interpolation = "nearest",
+            interpolation=interp_method,
             # interpolation="lanczos",
             extent=[Pmin2 / mW, Pmax2 / mW, Pmin1 / mW, Pmax1 / mW],
             aspect="auto",
+            rasterized=True,
         )
         # for (j, i), label in np.ndenumerate(opt):
         #     plt.text(i, j, label, ha="center", va="center")
@@ -958,32 +1481,26 @@ class Viz:
         im3 = ax3.imshow(
             opt_height,
             cmap=color_map,
-            interpolation="nearest",
+            interpolation=interp_method,
             # interpolation="lanczos",
             extent=[Pmin2 / mW, Pmax2 / mW, Pmin1 / mW, Pmax1 / mW],
             aspect="auto",
             rasterized=True,
         )
-        maximas = np.zeros(len(Prange1))
-        for i, _ in enumerate(Prange1):
-            maximas[i] = Prange2[np.argmax(opt_height[i, :])]
+        maximas = Prange2[np.argmax(opt_height, axis=1)]
         max_fit = np.polyfit(maximas / mW, Prange1 / mW, 2)
         max_p = np.poly1d(max_fit)
         a = ax3.plot(maximas / mW, max_p(maximas / mW), "--", color="white", lw=3)
-        cursor = mplcursors.cursor(
+        # a single cursor is kept for the optimization figures, the one of a previous call is disconnected
+        if self._opt_cursor is not None:
+            self._opt_cursor.remove()
+        # no highlight artist: it would be composited on top of the maps and redraw the whole figure on each pick
+        self._opt_cursor = mplcursors.cursor(
             a,
-            highlight=True,  # , highlight_kwargs=_custom_highlight_kwargs, annotation_kwargs=_custom_annotation_kwargs
+            hover=False,
+            highlight=False,  # , highlight_kwargs=_custom_highlight_kwargs, annotation_kwargs=_custom_annotation_kwargs
         )
-
-        @cursor.connect("add")
-        def on_add(sel):
-            artist = sel.artist
-            label = artist.get_label() or ""
-            x, y = sel.target
-            textx = f"P2 = {x:.1f} nm"
-            texty = f"P1 = {y:.2f} mK"
-            text = f"{textx}\n{texty}"
-            sel.annotation.set_text(text)
+        self._opt_cursor.connect("add", self._opt_on_add)
 
         # ax3.plot(maximas / mW, Prange1 / mW, "o", color="green")
         cbar = plt.colorbar(im3, ax=ax3)
@@ -1012,11 +1529,17 @@ class DiscreteSlider(Slider):
     """A matplotlib slider widget with discrete steps."""
 
     def __init__(self, *args, **kwargs):
-        self.allowed_vals = kwargs.pop("allowed_vals", None)
+        allowed_vals = kwargs.pop("allowed_vals", None)
+        if allowed_vals is None:
+            # set before Slider.__init__, which already calls set_val with valinit
+            allowed_vals = [
+                kwargs["valmin"] if "valmin" in kwargs else args[2],
+                kwargs["valmax"] if "valmax" in kwargs else args[3],
+            ]
+        # sorted once, so that the closest allowed value is found by bisection when dragging
+        self.allowed_vals = np.sort(np.asarray(allowed_vals, dtype=float))
         self.previous_val = kwargs["valinit"]
         Slider.__init__(self, *args, **kwargs)
-        if self.allowed_vals.all() == None:
-            self.allowed_vals = [self.valmin, self.valmax]
         for k in range(len(self.allowed_vals)):
             if self.orientation == "vertical":
                 self.hline = self.ax.axhline(self.allowed_vals[k], 0, 1, color="r", lw=1)
@@ -1024,21 +1547,6 @@ class DiscreteSlider(Slider):
                 self.vline = self.ax.axvline(self.allowed_vals[k], 0, 1, color="r", lw=1)
 
     def set_val(self, val):
-        discrete_val = self.allowed_vals[abs(val - self.allowed_vals).argmin()]
-        val = discrete_val
-        xy = self.poly.xy
-        if self.orientation == "vertical":
-            xy[1] = 0, val
-            xy[2] = 1, val
-        else:
-            xy[2] = val, 1
-            xy[3] = val, 0
-        self.poly.xy = xy
-        self.valtext.set_text(self.valfmt % val)
-        if self.drawon:
-            self.ax.figure.canvas.draw_idle()
-        self.val = val
-        if not self.eventson:
-            return
-        for cid, func in self.observers.items():
-            func(val)
+        discrete_val = self.allowed_vals[_nearest(self.allowed_vals, val)]
+        # the drawing of the slider and the call of the observers are left to matplotlib
+        Slider.set_val(self, discrete_val)